@@ -1,3 +1,4 @@
+import os
 import sqlite3
 
 def dict_factory(cursor, row):
@@ -12,6 +13,10 @@ class SquirrelDB:
         self.connection = sqlite3.connect("squirrel_db.db")
         self.connection.row_factory = dict_factory
         self.cursor = self.connection.cursor()
+        # optional pragmas, e.g. SQUIRREL_DB_PRAGMAS="journal_mode=MEMORY;synchronous=OFF"
+        for pragma in os.environ.get("SQUIRREL_DB_PRAGMAS", "").split(";"):
+            if pragma.strip():
+                self.cursor.execute("PRAGMA " + pragma.strip())
 
     def getSquirrels(self):
         self.cursor.execute("SELECT * FROM squirrels ORDER BY id")
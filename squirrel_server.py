@@ -1,13 +1,21 @@
 import json
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import parse_qs
 from squirrel_db import SquirrelDB
 
 class SquirrelServerHandler(BaseHTTPRequestHandler):
 
+    # keep connections alive between requests (every response sets Content-Length)
+    # and send small header/body writes without waiting on Nagle
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # close keep-alive connections left idle this many seconds, freeing their thread
+    timeout = 30
+
     # HTTP METHODS
 
     def do_GET(self):
+        self.readRequestBody()
         resourceName, resourceId = self.parsePath()
         if resourceName == "squirrels":
             if resourceId:
@@ -18,6 +26,7 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
             self.handle404()
 
     def do_POST(self):
+        self.readRequestBody()
         resourceName, resourceId = self.parsePath()
         if resourceName == "squirrels":
             if resourceId:
@@ -28,6 +37,7 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
             self.handle404()
 
     def do_PUT(self):
+        self.readRequestBody()
         resourceName, resourceId = self.parsePath()
         if resourceName == "squirrels":
             if resourceId:
@@ -38,6 +48,7 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
             self.handle404()
 
     def do_DELETE(self):
+        self.readRequestBody()
         resourceName, resourceId = self.parsePath()
         if resourceName == "squirrels":
             if resourceId:
@@ -49,9 +60,14 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
 
     # HELPERS
 
+    def readRequestBody(self):
+        # always consume the body, used or not, so the next request on a
+        # keep-alive connection starts at its request line
+        length = self.headers["Content-Length"]
+        self.requestBody = self.rfile.read(int(length)) if length else b""
+
     def getRequestData(self):
-        length = int(self.headers["Content-Length"])
-        body = self.rfile.read(length).decode("utf-8")
+        body = self.requestBody.decode("utf-8")
         data = parse_qs(body)
         for key in data:
             data[key] = data[key][0]
@@ -72,19 +88,23 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
     def handleSquirrelsIndex(self):
         db = SquirrelDB()
         squirrelsList = db.getSquirrels()
+        responseBody = bytes(json.dumps(squirrelsList), "utf-8")
         self.send_response(200)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(responseBody)))
         self.end_headers()
-        self.wfile.write(bytes(json.dumps(squirrelsList), "utf-8"))
+        self.wfile.write(responseBody)
 
     def handleSquirrelsRetrieve(self, squirrelId):
         db = SquirrelDB()
         squirrel = db.getSquirrel(squirrelId)
         if squirrel:
+            responseBody = bytes(json.dumps(squirrel), "utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(responseBody)))
             self.end_headers()
-            self.wfile.write(bytes(json.dumps(squirrel), "utf-8"))
+            self.wfile.write(responseBody)
         else:
             self.handle404()
 
@@ -94,15 +114,13 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
 
         # ---- NEW: validate required fields ----
         if "name" not in body or "size" not in body:
-            self.send_response(400)
-            self.send_header("Content-Type", "text/plain")
-            self.end_headers()
-            self.wfile.write(bytes("Bad Request", "utf-8"))
+            self.handle400()
             return
         # ----------------------------------------
 
         db.createSquirrel(body["name"], body["size"])
         self.send_response(201)
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def handleSquirrelsUpdate(self, squirrelId):
@@ -116,10 +134,7 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
 
         # ---- NEW: validate required fields ----
         if "name" not in body or "size" not in body:
-            self.send_response(400)
-            self.send_header("Content-Type", "text/plain")
-            self.end_headers()
-            self.wfile.write(bytes("Bad Request", "utf-8"))
+            self.handle400()
             return
         # ----------------------------------------
 
@@ -137,16 +152,26 @@ class SquirrelServerHandler(BaseHTTPRequestHandler):
         else:
             self.handle404()
 
+    def handle400(self):
+        responseBody = bytes("Bad Request", "utf-8")
+        self.send_response(400)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(responseBody)))
+        self.end_headers()
+        self.wfile.write(responseBody)
+
     def handle404(self):
+        responseBody = bytes("404 Not Found", "utf-8")
         self.send_response(404)
         self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(responseBody)))
         self.end_headers()
-        self.wfile.write(bytes("404 Not Found", "utf-8"))
+        self.wfile.write(responseBody)
 
 def run():
     print("squirrel_server running at 127.0.0.1:8080")
     listen = ("127.0.0.1", 8080)
-    server = HTTPServer(listen, SquirrelServerHandler)
+    server = ThreadingHTTPServer(listen, SquirrelServerHandler)
     server.serve_forever()
 
 if __name__ == '__main__':
@@ -1,69 +1,67 @@
 import pytest
 import os
 import pickle
-import tempfile
+from pathlib import Path
 from mydb import MyDB
 
 
+_EMPTY_PICKLE = pickle.dumps([])
+_PICKLE_CACHE = {}
+
+
+def _assert_file_eq(path, value):
+    # MyDB pickles with the default protocol, so equal lists give equal bytes
+    key = repr(value)
+    if key not in _PICKLE_CACHE:
+        _PICKLE_CACHE[key] = pickle.dumps(value)
+    expected = _PICKLE_CACHE[key]
+    assert Path(path).read_bytes() == expected
+
+
+@pytest.fixture(scope="session")
+def _db_path(tmp_path_factory):
+    # One temporary file for the whole session, reset before each test
+    return tmp_path_factory.mktemp("mydb") / "t.db"
+
+
 @pytest.fixture
-def temp_db_file():
-    # Create a temporary file and initialize with pickled empty list
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as tmp:
-        db_file = tmp.name
-        # Write an empty list to ensure valid pickle data
-        with open(db_file, 'wb') as f:
-            pickle.dump([], f)
-    yield db_file
-    # Tear down: Remove the file after each test
-    if os.path.exists(db_file):
-        os.remove(db_file)
+def temp_db_file(_db_path):
+    # Reset the file to a pickled empty list
+    _db_path.write_bytes(_EMPTY_PICKLE)
+    yield str(_db_path)
 
 
 def describe_mydb():
     def describe_init():
-        def it_creates_empty_file_if_not_exists():
-            # Create a non-existing file path
-            temp_dir = tempfile.gettempdir()
-            db_file = os.path.join(temp_dir, 'test_mydb.db')
-            if os.path.exists(db_file):
-                os.remove(db_file)
+        def it_creates_empty_file_if_not_exists(tmp_path):
+            # A path inside a fresh per-test directory, so it never exists yet
+            db_file = str(tmp_path / 'test_mydb.db')
             db = MyDB(db_file)
             assert os.path.isfile(db_file) is True
-            with open(db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == []
+            _assert_file_eq(db_file, [])
 
         def it_does_not_overwrite_existing_file(temp_db_file):
             # Pre-write a file with data
-            with open(temp_db_file, 'wb') as f:
-                pickle.dump(['existing'], f)
+            Path(temp_db_file).write_bytes(pickle.dumps(['existing']))
             db = MyDB(temp_db_file)
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['existing']
+            _assert_file_eq(temp_db_file, ['existing'])
 
     def describe_save_strings():
         def it_saves_empty_list(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveStrings([])
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == []
+            _assert_file_eq(temp_db_file, [])
 
         def it_saves_non_empty_list(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveStrings(['a', 'b'])
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['a', 'b']
+            _assert_file_eq(temp_db_file, ['a', 'b'])
 
         def it_overwrites_existing_content(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveStrings(['old'])
             db.saveStrings(['new'])
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['new']
+            _assert_file_eq(temp_db_file, ['new'])
 
     def describe_load_strings():
         def it_loads_empty_list_from_empty_file(temp_db_file):
@@ -81,22 +79,16 @@ def describe_mydb():
         def it_appends_to_empty_file(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveString('test')
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['test']
+            _assert_file_eq(temp_db_file, ['test'])
 
         def it_appends_to_existing_list(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveStrings(['a'])
             db.saveString('b')
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['a', 'b']
+            _assert_file_eq(temp_db_file, ['a', 'b'])
 
         def it_appends_multiple_strings(temp_db_file):
             db = MyDB(temp_db_file)
             db.saveString('first')
             db.saveString('second')
-            with open(temp_db_file, 'rb') as f:
-                data = pickle.load(f)
-            assert data == ['first', 'second']
\ No newline at end of file
+            _assert_file_eq(temp_db_file, ['first', 'second'])
@@ -1,68 +1,246 @@
 import pytest
+import gc
 import http.client
-import json
+import io
 import os
+import socket
 import subprocess
 import sys
 import time
 import urllib.parse
 import sqlite3
 from squirrel_db import SquirrelDB
+import squirrel_server
+from squirrel_server import SquirrelServerHandler
 
+try:
+    from orjson import loads as _jloads
+except ImportError:
+    from json import loads as _jloads
 
-@pytest.fixture(autouse=True)
-def setup_and_cleanup_database():
-    # Simulate squirrel_db.db.template by creating an empty squirrels table
-    db_file = "squirrel_db.db"
-    if os.path.exists(db_file):
-        os.remove(db_file)
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE squirrels (id INTEGER PRIMARY KEY, name TEXT, size TEXT)")
-    conn.commit()
-    conn.close()
+
+# Request bodies and headers are constant, so encode them once at import
+_REQUEST_BODY = urllib.parse.urlencode({'name': 'Sam', 'size': 'large'})
+_UPDATE_BODY = urllib.parse.urlencode({'name': 'Nutty', 'size': 'medium'})
+_REQUEST_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+# Requests the server must answer with 404 Not Found
+_NOT_FOUND_CASES = [
+    pytest.param("GET", "/unknown", None, id="unknown_path"),
+    pytest.param("POST", "/squirrels/1", _REQUEST_BODY, id="post_with_id"),
+    pytest.param("PUT", "/squirrels", _REQUEST_BODY, id="put_without_id"),
+    pytest.param("DELETE", "/squirrels", None, id="delete_without_id"),
+    pytest.param("GET", "/squirrels/1/extra", None, id="get_nested_path"),
+    pytest.param("POST", "/squirrels/1/extra", _REQUEST_BODY, id="post_nested_path"),
+    pytest.param("PUT", "/squirrels/1/extra", _REQUEST_BODY, id="put_nested_path"),
+    pytest.param("DELETE", "/squirrels/1/extra", None, id="delete_nested_path"),
+]
+
+# The test db is thrown away, so skip journaling fsyncs on every write
+_DB_PRAGMAS = "journal_mode=MEMORY;synchronous=OFF;temp_store=MEMORY"
+
+
+@pytest.fixture(autouse=True, scope='session')
+def check_fd_leaks():
+    # Declared first so it is torn down last: every socket, db connection and
+    # pipe opened during the session must be closed again (Linux only)
+    if not os.path.isdir('/proc/self/fd'):
+        yield
+        return
+    before = len(os.listdir('/proc/self/fd'))
     yield
-    # Clean up
-    if os.path.exists(db_file):
-        os.remove(db_file)
+    # sqlite3 connections sit in reference cycles; collect unreachable ones first
+    gc.collect()
+    assert len(os.listdir('/proc/self/fd')) == before
 
 
 @pytest.fixture(autouse=True, scope='session')
+def create_database():
+    # Simulate squirrel_db.db.template by creating the squirrels table once
+    conn = sqlite3.connect("squirrel_db.db")
+    conn.execute("CREATE TABLE IF NOT EXISTS squirrels (id INTEGER PRIMARY KEY, name TEXT, size TEXT)")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope='session')
+def _reset_conn(create_database):
+    # Autocommit connection kept open for resetting rows between tests
+    conn = sqlite3.connect("squirrel_db.db", isolation_level=None)
+    for pragma in _DB_PRAGMAS.split(";"):
+        conn.execute("PRAGMA " + pragma)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(autouse=True)
+def setup_and_cleanup_database(_reset_conn):
+    # Empty the table instead of recreating the file, so the server keeps a stable db file.
+    # ids are plain INTEGER PRIMARY KEY (no AUTOINCREMENT), so they restart at 1 once empty.
+    _reset_conn.execute("DELETE FROM squirrels")
+
+
+@pytest.fixture(scope='session')
 def start_and_stop_server():
+    # A stale server still holding the port would answer the readiness probe
+    try:
+        socket.create_connection(('localhost', 8080), timeout=0.05).close()
+    except OSError:
+        pass
+    else:
+        raise RuntimeError("port 8080 is already in use; is an old squirrel_server still running?")
     # Start the server
-    proc = subprocess.Popen([sys.executable, 'squirrel_server.py'])
-    time.sleep(0.5)  # Wait for server to start
+    proc = subprocess.Popen([sys.executable, '-u', 'squirrel_server.py'],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, close_fds=True,
+                            env={**os.environ, 'SQUIRREL_DB_PRAGMAS': _DB_PRAGMAS})
+    # Wait (up to 1s) until the server accepts connections
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError(f"squirrel_server exited during startup with code {proc.returncode}")
+        try:
+            socket.create_connection(('localhost', 8080), timeout=0.05).close()
+            break
+        except OSError:
+            time.sleep(0.01)
+    else:
+        proc.terminate()
+        proc.wait()
+        raise RuntimeError("squirrel_server did not start listening on port 8080")
     yield
     # Stop the server
     proc.terminate()
     proc.wait()
 
 
-@pytest.fixture
-def http_client():
-    conn = http.client.HTTPConnection('localhost:8080')
+class KeepAliveConnection(http.client.HTTPConnection):
+    # Shared across tests, so finish reading whatever response the previous
+    # request left behind before sending the next one. http.client itself
+    # reconnects after a response that closes the connection (e.g. 501).
+
+    _pending = None
+
+    def request(self, *args, **kwargs):
+        if self._pending is not None:
+            self._pending.read()
+            self._pending = None
+        super().request(*args, **kwargs)
+
+    def getresponse(self):
+        self._pending = super().getresponse()
+        return self._pending
+
+    def close(self):
+        # a closing response (e.g. 501) keeps its own handle on the socket
+        if self._pending is not None:
+            self._pending.close()
+            self._pending = None
+        super().close()
+
+
+@pytest.fixture(scope='session')
+def server_client(start_and_stop_server):
+    # Talks to the real squirrel_server subprocess over TCP
+    conn = KeepAliveConnection('localhost:8080')
     yield conn
     conn.close()
 
 
-@pytest.fixture
-def request_body():
-    return urllib.parse.urlencode({'name': 'Sam', 'size': 'large'})
+def _raw_request(method, path, body=None, headers=None):
+    # Serialize an HTTP/1.1 request the way http.client would send it
+    headers = headers or {}
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+    lines += [f"{key}: {value}" for key, value in headers.items()]
+    if body is not None:
+        lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
 
 
-@pytest.fixture
-def request_headers():
-    return {'Content-Type': 'application/x-www-form-urlencoded'}
+class _InProcessHandler(SquirrelServerHandler):
+    # Serves a raw request held in memory instead of reading from a socket
 
+    def setup(self):
+        self.rfile = io.BytesIO(self.request)
+        self.wfile = io.BytesIO()
 
-@pytest.fixture
+    def finish(self):
+        pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _SharedReader:
+    # Lets consecutive HTTPResponse objects parse pipelined responses from one
+    # buffered stream; HTTPResponse closes its file once a body is read
+    def __init__(self, fp):
+        self.fp = fp
+
+    def makefile(self, mode):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+
+class _ResponseBytes:
+    # Just enough of a socket for http.client.HTTPResponse to parse from
+    def __init__(self, data):
+        self.data = data
+
+    def makefile(self, mode):
+        return io.BytesIO(self.data)
+
+
+class InProcessConnection:
+    # Same request()/getresponse() interface as http.client.HTTPConnection,
+    # but runs SquirrelServerHandler directly: no subprocess, socket or port
+
+    _response = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = headers or {}
+        handler = _InProcessHandler(_raw_request(method, path, body, headers), ("127.0.0.1", 0), None)
+        self._response = http.client.HTTPResponse(_ResponseBytes(handler.wfile.getvalue()), method=method)
+
+    def getresponse(self):
+        response = self._response
+        response.begin()
+        return response
+
+
+@pytest.fixture(scope='session')
+def http_client(create_database):
+    # Handlers share one session connection instead of opening one per request;
+    # sqlite3 caches prepared statements per connection, so repeated queries
+    # are not re-parsed either. It is separate from the db fixture, so the
+    # tests' checks only see data the handlers actually committed.
+    with pytest.MonkeyPatch.context() as mp:
+        # same pragmas as the subprocess server, since these tests do the writes
+        mp.setenv("SQUIRREL_DB_PRAGMAS", _DB_PRAGMAS)
+        handler_db = SquirrelDB()
+        mp.setattr(squirrel_server, "SquirrelDB", lambda: handler_db)
+        yield InProcessConnection()
+    handler_db.connection.close()
+
+
+@pytest.fixture(scope='session')
 def db():
-    return SquirrelDB()
+    # One connection for the session; rows are reset by setup_and_cleanup_database
+    squirrel_db = SquirrelDB()
+    yield squirrel_db
+    squirrel_db.connection.close()
 
 
 @pytest.fixture
-def make_a_squirrel(db):
-    db.createSquirrel("Fred", "small")
+def make_a_squirrel(_reset_conn):
+    # Seed on the already-open reset connection (autocommit, table already emptied)
+    _reset_conn.execute("INSERT INTO squirrels (name, size) VALUES ('Fred', 'small')")
 
 
 def describe_squirrel_server_api():
@@ -81,13 +259,13 @@ def describe_squirrel_server_api():
             http_client.request("GET", "/squirrels")
             response = http_client.getresponse()
             response_body = response.read()
-            assert json.loads(response_body) == []
+            assert _jloads(response_body) == []
 
         def it_returns_json_array_with_one_squirrel(http_client, make_a_squirrel):
             http_client.request("GET", "/squirrels")
             response = http_client.getresponse()
             response_body = response.read()
-            squirrels = json.loads(response_body)
+            squirrels = _jloads(response_body)
             assert len(squirrels) == 1
             assert squirrels[0] == {"id": 1, "name": "Fred", "size": "small"}
 
@@ -97,7 +275,7 @@ def describe_squirrel_server_api():
             http_client.request("GET", "/squirrels")
             response = http_client.getresponse()
             response_body = response.read()
-            squirrels = json.loads(response_body)
+            squirrels = _jloads(response_body)
             assert len(squirrels) == 2
             assert squirrels == [
                 {"id": 1, "name": "Fred", "size": "small"},
@@ -108,7 +286,7 @@ def describe_squirrel_server_api():
         def it_returns_squirrel_if_exists(http_client, make_a_squirrel):
             http_client.request("GET", "/squirrels/1")
             response = http_client.getresponse()
-            response_body = json.loads(response.read())
+            response_body = _jloads(response.read())
             assert response.status == 200
             assert response.getheader('Content-Type') == "application/json"
             assert response_body == {"id": 1, "name": "Fred", "size": "small"}
@@ -118,11 +296,11 @@ def describe_squirrel_server_api():
             response = http_client.getresponse()
             assert response.status == 404
             assert response.getheader('Content-Type') == "text/plain"
-            assert response.read().decode('utf-8') == "404 Not Found"
+            assert response.read() == b"404 Not Found"
 
     def describe_post_squirrels():
-        def it_creates_squirrel_and_returns_201(http_client, request_headers, request_body, db):
-            http_client.request("POST", "/squirrels", body=request_body, headers=request_headers)
+        def it_creates_squirrel_and_returns_201(http_client, db):
+            http_client.request("POST", "/squirrels", body=_REQUEST_BODY, headers=_REQUEST_HEADERS)
             response = http_client.getresponse()
             assert response.status == 201
             # Verify database side effect
@@ -130,34 +308,32 @@ def describe_squirrel_server_api():
             assert len(squirrels) == 1
             assert squirrels[0] == {"id": 1, "name": "Sam", "size": "large"}
 
-        # def it_fails_with_crash_for_missing_data(http_client, request_headers, db):
+        # def it_fails_with_crash_for_missing_data(http_client, db):
         #     empty_body = urllib.parse.urlencode({})
-        #     http_client.request("POST", "/squirrels", body=empty_body, headers=request_headers)
+        #     http_client.request("POST", "/squirrels", body=empty_body, headers=_REQUEST_HEADERS)
         #     with pytest.raises(http.client.RemoteDisconnected):
         #         http_client.getresponse()
         #     # Verify no database changes
         #     assert len(db.getSquirrels()) == 0
 
     def describe_put_squirrels():
-        def it_updates_existing_squirrel(http_client, request_headers, make_a_squirrel, db):
-            update_body = urllib.parse.urlencode({'name': 'Nutty', 'size': 'medium'})
-            http_client.request("PUT", "/squirrels/1", body=update_body, headers=request_headers)
+        def it_updates_existing_squirrel(http_client, make_a_squirrel, db):
+            http_client.request("PUT", "/squirrels/1", body=_UPDATE_BODY, headers=_REQUEST_HEADERS)
             response = http_client.getresponse()
             assert response.status == 204
             # Verify database side effect
             squirrel = db.getSquirrel("1")
             assert squirrel == {"id": 1, "name": "Nutty", "size": "medium"}
 
-        def it_returns_404_for_non_existing_id(http_client, request_headers):
-            body = urllib.parse.urlencode({'name': 'Nutty', 'size': 'medium'})
-            http_client.request("PUT", "/squirrels/999", body=body, headers=request_headers)
+        def it_returns_404_for_non_existing_id(http_client):
+            http_client.request("PUT", "/squirrels/999", body=_UPDATE_BODY, headers=_REQUEST_HEADERS)
             response = http_client.getresponse()
             assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
+            assert response.read() == b"404 Not Found"
 
-        # def it_fails_with_crash_for_missing_data(http_client, request_headers, make_a_squirrel, db):
+        # def it_fails_with_crash_for_missing_data(http_client, make_a_squirrel, db):
         #     empty_body = urllib.parse.urlencode({})
-        #     http_client.request("PUT", "/squirrels/1", body=empty_body, headers=request_headers)
+        #     http_client.request("PUT", "/squirrels/1", body=empty_body, headers=_REQUEST_HEADERS)
         #     with pytest.raises(http.client.RemoteDisconnected):
         #         http_client.getresponse()
         #     # Verify no database changes
@@ -177,105 +353,93 @@ def describe_squirrel_server_api():
             http_client.request("DELETE", "/squirrels/999")
             response = http_client.getresponse()
             assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
+            assert response.read() == b"404 Not Found"
 
     def describe_404_failure_conditions():
-        def it_returns_404_for_unknown_path(http_client):
-            http_client.request("GET", "/unknown")
+        @pytest.mark.parametrize("method,path,body", _NOT_FOUND_CASES)
+        def it_returns_404(http_client, method, path, body):
+            http_client.request(method, path, body=body, headers=_REQUEST_HEADERS if body else {})
             response = http_client.getresponse()
             assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_post_with_id(http_client, request_headers, request_body):
-            http_client.request("POST", "/squirrels/1", body=request_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_put_without_id(http_client, request_headers, request_body):
-            http_client.request("PUT", "/squirrels", body=request_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_delete_without_id(http_client):
-            http_client.request("DELETE", "/squirrels")
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_get_nested_path(http_client):
-            http_client.request("GET", "/squirrels/1/extra")
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_post_nested_path(http_client, request_headers, request_body):
-            http_client.request("POST", "/squirrels/1/extra", body=request_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_put_nested_path(http_client, request_headers, request_body):
-            http_client.request("PUT", "/squirrels/1/extra", body=request_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
-
-        def it_returns_404_for_delete_nested_path(http_client):
-            http_client.request("DELETE", "/squirrels/1/extra")
-            response = http_client.getresponse()
-            assert response.status == 404
-            assert response.read().decode('utf-8') == "404 Not Found"
+            assert response.read() == b"404 Not Found"
 
     def describe_501_failure_conditions():
-        def it_returns_501_for_invalid_method_get(http_client):
-            http_client.request("PATCH", "/squirrels")
-            response = http_client.getresponse()
-            assert response.status == 501
-            assert "Unsupported method" in response.read().decode('utf-8')
-
-        def it_returns_501_for_invalid_method_id(http_client):
-            http_client.request("PATCH", "/squirrels/1")
+        @pytest.mark.parametrize("path", ["/squirrels", "/squirrels/1"], ids=["collection", "id"])
+        def it_returns_501_for_invalid_method(http_client, path):
+            http_client.request("PATCH", path)
             response = http_client.getresponse()
             assert response.status == 501
-            assert "Unsupported method" in response.read().decode('utf-8')
-    
+            assert b"Unsupported method" in response.read()
 
     def describe_bad_request_400():
-        def it_returns_400_when_creating_with_missing_size(http_client, request_headers, db):
-            bad_body = urllib.parse.urlencode({'name': 'Fluffy'})  # missing size
-            http_client.request("POST", "/squirrels", body=bad_body, headers=request_headers)
+        @pytest.mark.parametrize("method,path,body", [
+            ("POST", "/squirrels", "name=Fluffy"),
+            ("POST", "/squirrels", "size=large"),
+            ("PUT", "/squirrels/1", "name=Nutty"),
+            ("PUT", "/squirrels/1", "size=medium"),
+        ], ids=[
+            "creating_with_missing_size", "creating_with_missing_name",
+            "updating_with_missing_size", "updating_with_missing_name",
+        ])
+        def it_returns_400(http_client, make_a_squirrel, db, method, path, body):
+            http_client.request(method, path, body=body, headers=_REQUEST_HEADERS)
             response = http_client.getresponse()
             assert response.status == 400
             assert response.getheader('Content-Type') == "text/plain"
-            body = response.read().decode('utf-8')
-            assert "Bad Request" in body
-            # Database unchanged
-            assert len(db.getSquirrels()) == 0
-
-        def it_returns_400_when_creating_with_missing_name(http_client, request_headers, db):
-            bad_body = urllib.parse.urlencode({'size': 'large'})  # missing name
-            http_client.request("POST", "/squirrels", body=bad_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 400
-            assert "Bad Request" in response.read().decode('utf-8')
-            assert len(db.getSquirrels()) == 0
-
-        def it_returns_400_when_updating_with_missing_size(http_client, request_headers, make_a_squirrel, db):
-            bad_body = urllib.parse.urlencode({'name': 'Nutty'})  # missing size
-            http_client.request("PUT", "/squirrels/1", body=bad_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 400
-            assert "Bad Request" in response.read().decode('utf-8')
-            # Verify original data unchanged
-            squirrel = db.getSquirrel("1")
-            assert squirrel["name"] == "Fred"
-
-        def it_returns_400_when_updating_with_missing_name(http_client, request_headers, make_a_squirrel, db):
-            bad_body = urllib.parse.urlencode({'size': 'medium'})  # missing name
-            http_client.request("PUT", "/squirrels/1", body=bad_body, headers=request_headers)
-            response = http_client.getresponse()
-            assert response.status == 400
-            squirrel = db.getSquirrel("1")
-            assert squirrel["name"] == "Fred"  # unchanged
\ No newline at end of file
+            assert b"Bad Request" in response.read()
+            # Database unchanged: the seeded squirrel is still the only one
+            assert db.getSquirrels() == [{"id": 1, "name": "Fred", "size": "small"}]
+
+
+def describe_running_server():
+    # Smoke tests against the real subprocess; the API tests above run in-process
+    def it_lists_squirrels(server_client, make_a_squirrel):
+        server_client.request("GET", "/squirrels")
+        response = server_client.getresponse()
+        assert response.status == 200
+        assert response.getheader('Content-Type') == "application/json"
+        assert _jloads(response.read()) == [{"id": 1, "name": "Fred", "size": "small"}]
+
+    def it_creates_squirrel(server_client, db):
+        server_client.request("POST", "/squirrels", body=_REQUEST_BODY, headers=_REQUEST_HEADERS)
+        response = server_client.getresponse()
+        assert response.status == 201
+        assert db.getSquirrels() == [{"id": 1, "name": "Sam", "size": "large"}]
+
+    def it_returns_501_for_unsupported_method(server_client):
+        server_client.request("PATCH", "/squirrels")
+        response = server_client.getresponse()
+        assert response.status == 501
+
+    def it_returns_404_for_pipelined_requests(start_and_stop_server):
+        # All requests go out in one write on one keep-alive connection; the
+        # responses come back in order, so any unread request body would
+        # corrupt every response after it
+        cases = [case.values for case in _NOT_FOUND_CASES]
+        with socket.create_connection(('localhost', 8080)) as sock:
+            sock.sendall(b"".join(_raw_request(method, path, body, _REQUEST_HEADERS)
+                                  for method, path, body in cases))
+            with sock.makefile('rb') as fp:
+                reader = _SharedReader(fp)
+                for method, path, body in cases:
+                    response = http.client.HTTPResponse(reader, method=method)
+                    response.begin()
+                    assert response.status == 404
+                    assert response.read() == b"404 Not Found"
+
+    def it_discards_unused_request_bodies(start_and_stop_server, make_a_squirrel):
+        # GET and DELETE ignore a body; it must still be consumed so the
+        # following request on the same connection parses cleanly
+        with socket.create_connection(('localhost', 8080)) as sock:
+            sock.sendall(_raw_request("GET", "/squirrels", _REQUEST_BODY, _REQUEST_HEADERS)
+                         + _raw_request("DELETE", "/squirrels/1", _REQUEST_BODY, _REQUEST_HEADERS)
+                         + _raw_request("GET", "/squirrels/1"))
+            with sock.makefile('rb') as fp:
+                reader = _SharedReader(fp)
+                statuses = []
+                for method in ("GET", "DELETE", "GET"):
+                    response = http.client.HTTPResponse(reader, method=method)
+                    response.begin()
+                    response.read()
+                    statuses.append(response.status)
+        assert statuses == [200, 204, 404]